@@ -44,9 +44,11 @@ logger = logging.getLogger(__name__)
 class FailureException(Exception):
     """Basic failure exception I can throw to force a retry."""
 
-    def __init__(self, code, message="Something went wrong"):
+    def __init__(self, code, message="Something went wrong", retry_after=None, retryable=True):
         self.code = code
         self.message = message
+        self.retry_after = retry_after
+        self.retryable = retryable
         super().__init__(self.message)
         super().__init__(self.code)
 
@@ -7,17 +7,19 @@ from yarl import URL
 
 @dataclass
 class FileLock:
-    locked_files = []
+    """Class for keeping track of file paths currently being written, waiters are woken when the lock is removed"""
+    locked_files: ClassVar[Dict[str, asyncio.Event]] = {}
 
-    async def check_lock(self, filename):
-        await asyncio.sleep(.1)
-        return filename.lower() in self.locked_files
+    async def get_event(self, path) -> Optional[asyncio.Event]:
+        return self.locked_files.get(path.lower())
 
-    async def add_lock(self, filename):
-        self.locked_files.append(filename.lower())
+    async def add_lock(self, path):
+        self.locked_files[path.lower()] = asyncio.Event()
 
-    async def remove_lock(self, filename):
-        self.locked_files.remove(filename.lower())
+    async def remove_lock(self, path):
+        event = self.locked_files.pop(path.lower(), None)
+        if event:
+            event.set()
 
 
 @dataclass
@@ -3,6 +3,9 @@ import logging
 import sqlite3
 import os
 
+# Number of buffered inserts to collect before they are written with executemany
+INSERT_BUFFER_SIZE = 128
+
 
 class SQLHelper:
     def __init__(self, ignore_history, download_history):
@@ -10,6 +13,11 @@ class SQLHelper:
         self.download_history = download_history
         self.conn = None
         self.curs = None
+        # Paths known to be completed, shared by all downloaders during the run
+        self.completed_paths = set()
+        # Inserts are "OR IGNORE" so their order relative to the other writes doesn't matter, reads flush them first
+        self.file_buffer = []
+        self.temp_buffer = []
         # Close the sql connection when the program exits
         atexit.register(self.exit_handler)
 
@@ -18,6 +26,8 @@ class SQLHelper:
             os.remove("download_history_size_based.sqlite")
         self.conn = sqlite3.connect(self.download_history)
         self.curs = self.conn.cursor()
+        self.curs.execute("PRAGMA journal_mode=WAL;")
+        self.curs.execute("PRAGMA synchronous=NORMAL;")
         create_table_query = """CREATE TABLE IF NOT EXISTS downloads (
                                     path TEXT,
                                     downloaded_filename TEXT,
@@ -65,38 +75,61 @@ class SQLHelper:
             self.curs.execute(create_table_query)
             self.conn.commit()
 
-    async def sql_check_existing(self, path):
-        if self.ignore_history:
-            return False
-        self.curs.execute("""SELECT completed FROM downloads WHERE path = ?""", (path, ))
-        sql_file_check = self.curs.fetchone()
-        return sql_file_check and sql_file_check[0] == 1
+    def flush(self):
+        if self.file_buffer:
+            self.curs.executemany("""INSERT OR IGNORE INTO downloads VALUES (?, ?, ?)""", self.file_buffer)
+            self.file_buffer = []
+        if self.temp_buffer:
+            self.curs.executemany("""INSERT OR IGNORE INTO downloads_temp VALUES (?)""", self.temp_buffer)
+            self.temp_buffer = []
 
-    async def sql_insert_temp(self, downloaded_filename):
-        self.curs.execute("""INSERT OR IGNORE INTO downloads_temp VALUES (?)""", (downloaded_filename,))
+    async def commit(self):
+        self.flush()
         self.conn.commit()
 
+    async def sql_insert_temp(self, downloaded_filename):
+        self.temp_buffer.append((downloaded_filename, ))
+        if len(self.temp_buffer) >= INSERT_BUFFER_SIZE:
+            self.flush()
+
     async def sql_insert_file(self, path, downloaded_filename, completed):
-        self.curs.execute("""INSERT OR IGNORE INTO downloads VALUES (?, ?, ?)""", (path, downloaded_filename, completed, ))
-        self.conn.commit()
+        self.file_buffer.append((path, downloaded_filename, completed, ))
+        if len(self.file_buffer) >= INSERT_BUFFER_SIZE:
+            self.flush()
+        if completed == 1 and not self.ignore_history:
+            self.completed_paths.add(path)
 
     async def sql_update_file(self, path, downloaded_filename, completed):
         self.curs.execute("""INSERT OR REPLACE INTO downloads VALUES (?, ?, ?)""", (path, downloaded_filename, completed, ))
-        self.conn.commit()
+        if completed == 1 and not self.ignore_history:
+            self.completed_paths.add(path)
 
     async def check_filename(self, filename):
+        self.flush()
         self.curs.execute("""SELECT EXISTS(SELECT 1 FROM downloads WHERE downloaded_filename = ?)""", (filename, ))
         sql_check = self.curs.fetchone()[0]
         return sql_check == 1
 
-    async def get_download_filename(self, path):
-        self.curs.execute("""SELECT downloaded_filename FROM downloads WHERE path = ?""", (path, ))
-        filename = self.curs.fetchone()
-        if filename:
-            return filename[0]
-        return None
+    async def bulk_load(self, paths):
+        """Fetches the known download filenames for a batch of paths at once, recording completed paths."""
+        download_names = {}
+        self.flush()
+        paths = list(set(paths))
+        # Stay under SQLite's default host parameter limit
+        for i in range(0, len(paths), 900):
+            chunk = paths[i:i + 900]
+            placeholders = ','.join('?' * len(chunk))
+            self.curs.execute(f"""SELECT path, downloaded_filename, completed FROM downloads
+                                  WHERE path IN ({placeholders})""", chunk)
+            for path, downloaded_filename, completed in self.curs.fetchall():
+                if completed == 1 and not self.ignore_history:
+                    self.completed_paths.add(path)
+                if downloaded_filename:
+                    download_names[path] = downloaded_filename
+        return download_names
 
     async def get_temp_names(self):
+        self.flush()
         self.curs.execute("SELECT downloaded_filename FROM downloads_temp;")
         filenames = self.curs.fetchall()
         filenames = list(sum(filenames, ()))
@@ -104,6 +137,7 @@ class SQLHelper:
 
     def exit_handler(self):
         try:
+            self.flush()
             self.conn.commit()
             self.conn.close()
         except Exception as e:
@@ -1,11 +1,16 @@
 import asyncio
 import json
+from collections import namedtuple
 import logging
 import ssl
 from pathlib import Path
 import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
 
 import aiofiles
+import aiofiles.os
 from bs4 import BeautifulSoup
 from yarl import URL
 
@@ -15,7 +20,29 @@ from tqdm import tqdm
 
 from .rate_limiting import AsyncRateLimiter, throttle
 from ..base_functions.base_functions import logger, FailureException
-from ..base_functions.data_classes import FileLock
+
+
+def get_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header (either delta-seconds or an HTTP-date) into seconds to wait."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+
+
+# Minimum seconds between progress bar redraws
+PROGRESS_INTERVAL = 0.3
+
+FileMeta = namedtuple('FileMeta', ['filename', 'content_type', 'size'])
 
 
 class Client:
@@ -98,17 +125,29 @@ class DownloadSession:
         self.client = client
         self.headers = {"user-agent": client.user_agent}
         self.timeouts = aiohttp.ClientTimeout(5*60, conn_timeout)
+        # Per host concurrency is bounded by the Downloader semaphores, the connector only keeps connections warm
+        self.connector = aiohttp.TCPConnector(keepalive_timeout=30)
         self.client_session = aiohttp.ClientSession(headers=self.headers, raise_for_status=True,
-                                                    cookie_jar=self.client.cookies, timeout=self.timeouts)
+                                                    cookie_jar=self.client.cookies, timeout=self.timeouts,
+                                                    connector=self.connector)
         self.throttle_times = {}
 
-    async def get_filename(self, url: URL, referer: str, current_throttle: int):
+    async def exit_handler(self):
+        try:
+            await self.client_session.close()
+        except Exception as e:
+            logging.debug(f"Failed to close session.")
+
+    async def get_file_meta(self, url: URL, referer: str, current_throttle: int) -> FileMeta:
+        """Fetches the filename, content type and size of a file from a single response's headers."""
         headers = {'Referer': referer, 'user-agent': self.client.user_agent}
         await throttle(self, current_throttle, url.host)
         async with self.client_session.get(url, headers=headers, ssl=self.client.ssl_context,
                                            raise_for_status=True) as resp:
-            filename = resp.content_disposition.filename
-            return filename
+            filename = resp.content_disposition.filename if resp.content_disposition else None
+            content_type = resp.headers.get('Content-Type', '').lower()
+            total_size = int(resp.headers.get('Content-Length', str(0)))
+            return FileMeta(filename, content_type, total_size)
 
     async def get_filesize(self, url: URL, referer: str, current_throttle: int):
         headers = {'Referer': referer, 'user-agent': self.client.user_agent}
@@ -118,36 +157,36 @@ class DownloadSession:
             total_size = int(resp.headers.get('Content-Length', str(0)))
             return total_size
 
-    async def get_content_type(self, url: URL, referer: str, current_throttle: int):
-        headers = {'Referer': referer, 'user-agent': self.client.user_agent}
-        await throttle(self, current_throttle, url.host)
-        async with self.client_session.get(url, headers=headers, ssl=self.client.ssl_context,
-                                           raise_for_status=True) as resp:
-            content_type = resp.headers.get('Content-Type')
-            return content_type.lower()
-
-    async def download_file(self, url: URL, referer: str, current_throttle: int, range_num: str, original_filename: str,
-                            filename: str, temp_file: str, resume_point: int, show_progress: bool,
-                            File_Lock: FileLock, folder: Path, title: str, proxy: str):
+    async def download_file(self, url: URL, referer: str, current_throttle: int, range_num: str, filename: str,
+                            temp_file: str, resume_point: int, show_progress: bool, folder: Path, title: str,
+                            proxy: str) -> int:
         headers = {'Referer': referer, 'user-agent': self.client.user_agent}
         if range_num:
             headers['Range'] = range_num
         await throttle(self, current_throttle, url.host)
-        async with self.client_session.get(url, headers=headers, ssl=self.client.ssl_context,
-                                           raise_for_status=True, proxy=proxy) as resp:
-            content_type = resp.headers.get('Content-Type')
-            if 'text' in content_type.lower() or 'html' in content_type.lower():
-                logger.debug("Server for %s is either down or the file no longer exists", str(url))
-                await File_Lock.remove_lock(original_filename)
-                raise FailureException(code=resp.status, message="Unexpectedly got text as response")
-
-            total = int(resp.headers.get('Content-Length', str(0))) + resume_point
-            (folder / title).mkdir(parents=True, exist_ok=True)
-
-            with tqdm(total=total, unit_scale=True, unit='B', leave=False, initial=resume_point, desc=filename,
-                      disable=(not show_progress)) as progress:
-                async with aiofiles.open(temp_file, mode='ab') as f:
-                    async for chunk, _ in resp.content.iter_chunks():
-                        await asyncio.sleep(0)
-                        await f.write(chunk)
-                        progress.update(len(chunk))
+        try:
+            async with self.client_session.get(url, headers=headers, ssl=self.client.ssl_context,
+                                               raise_for_status=True, proxy=proxy) as resp:
+                content_type = resp.headers.get('Content-Type')
+                if 'text' in content_type.lower() or 'html' in content_type.lower():
+                    logger.debug("Server for %s is either down or the file no longer exists", str(url))
+                    raise FailureException(code=resp.status, message="Unexpectedly got text as response")
+
+                total = int(resp.headers.get('Content-Length', str(0))) + resume_point
+                await aiofiles.os.makedirs(folder / title, exist_ok=True)
+
+                size = resume_point
+                with tqdm(total=total, unit_scale=True, unit='B', leave=False, initial=resume_point, desc=filename,
+                          disable=(not show_progress), mininterval=PROGRESS_INTERVAL) as progress:
+                    async with aiofiles.open(temp_file, mode='ab') as f:
+                        async for chunk, _ in resp.content.iter_chunks():
+                            await asyncio.sleep(0)
+                            await f.write(chunk)
+                            progress.update(len(chunk))
+                            size += len(chunk)
+                return size
+        except aiohttp.ClientResponseError as e:
+            if e.status in (429, 503):
+                retry_after = get_retry_after(e.headers.get('Retry-After') if e.headers else None)
+                raise FailureException(code=e.status, message=e.message, retry_after=retry_after) from e
+            raise
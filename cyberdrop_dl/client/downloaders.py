@@ -1,10 +1,11 @@
 import asyncio
 import logging
-import traceback
+import os
+from collections import defaultdict
 from functools import wraps
 from pathlib import Path
-from typing import List, Tuple, Dict
-from random import gauss
+from typing import List, Tuple, Dict, Optional, Set
+from random import uniform
 
 import aiofiles
 import aiofiles.os
@@ -15,7 +16,69 @@ from yarl import URL
 from ..base_functions.base_functions import FILE_FORMATS, MAX_FILENAME_LENGTH, log, logger, sanitize, FailureException
 from ..base_functions.sql_helper import SQLHelper
 from ..base_functions.data_classes import AlbumItem, CascadeItem, FileLock
-from ..client.client import Client, DownloadSession
+from ..client.client import Client, DownloadSession, FileMeta, PROGRESS_INTERVAL
+
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+JITTER = 0.5
+
+VALID_EXTS = frozenset().union(*FILE_FORMATS.values())
+EXCLUDE_FORMATS = {'videos': 'Videos', 'images': 'Images', 'audio': 'Audio', 'other': 'Other'}
+
+# Host families that need special handling while downloading
+HOST_CLASSES = ('cyberdrop', 'cyberfile', 'anonfiles', 'bunkr', 'pixeldrain')
+# Hosts that rate limit aggressively, these get fewer workers than the rest
+LIMITED_HOSTS = ('bunkr', 'pixeldrain', 'anonfiles')
+LIMITED_HOST_WORKERS = 2
+# Semaphore key for hosts outside of HOST_CLASSES
+DEFAULT_HOST = 'default'
+# Albums downloaded at the same time by run_all
+MAX_CONCURRENT_ALBUMS = 4
+
+_host_class_cache: Dict[str, Optional[str]] = {}
+
+
+def classify_host(host: str) -> Optional[str]:
+    """Maps a host to the host family it belongs to (if any), memoized per host."""
+    if host in _host_class_cache:
+        return _host_class_cache[host]
+    host_class = None
+    for key in HOST_CLASSES:
+        if key in host:
+            host_class = key
+            break
+    _host_class_cache[host] = host_class
+    return host_class
+
+
+# Album folder -> {filename: size}, shared by every Downloader writing into that folder
+_dir_indexes: Dict[Path, Dict[str, int]] = {}
+
+
+# History paths currently being downloaded, so a link shared by several albums is only fetched once
+_active_links: Dict[str, asyncio.Event] = {}
+
+
+def scan_dir(album_dir: Path) -> Dict[str, int]:
+    """Indexes a folder (filename -> size) once, instead of stat-ing every candidate file."""
+    index = {}
+    try:
+        with os.scandir(album_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    index[entry.name] = entry.stat().st_size
+    except FileNotFoundError:
+        pass
+    return index
+
+
+async def get_dir_index(album_dir: Path) -> Dict[str, int]:
+    """Returns the shared index for an album folder, scanning the folder the first time it is requested."""
+    if album_dir not in _dir_indexes:
+        index = await asyncio.get_event_loop().run_in_executor(None, scan_dir, album_dir)
+        # Another Downloader for the same folder may have finished its scan first, keep using that one
+        _dir_indexes.setdefault(album_dir, index)
+    return _dir_indexes[album_dir]
 
 
 def retry(f):
@@ -23,177 +86,252 @@ def retry(f):
     async def wrapper(self, *args, **kwargs):
         while True:
             try:
-                return await f(self, *args, **kwargs)
-            except FailureException:
+                result = await f(self, *args, **kwargs)
+                self.current_attempt.pop(args[0], None)
+                return result
+            except FailureException as exc:
+                url = args[0]
+                host = url.host
+                if not exc.retryable:
+                    logger.debug('Skipping %s...', url)
+                    self.current_attempt.pop(url, None)
+                    raise
+                attempt = self.current_attempt[url]
                 if not self.disable_attempt_limit:
-                    if self.current_attempt[str(args[0])] >= self.attempts - 1:
-                        logger.debug('Skipping %s...', args[0])
+                    if attempt >= self.attempts - 1:
+                        logger.debug('Skipping %s...', url)
+                        self.current_attempt.pop(url, None)
                         raise
-                logger.debug(f'Retrying ({self.current_attempt[str(args[0])]}) {args[0]}...')
-                self.current_attempt[str(args[0])] += 1
-
-                if 'cyberdrop' in args[0].host:
-                    ext = '.'+args[0].name.split('.')[-1]
+                logger.debug('Retrying (%s) %s...', attempt, url)
+                # Retry-After is honoured, but never beyond MAX_DELAY so one bad header can't stall a worker
+                if exc.retry_after is not None:
+                    delay = min(exc.retry_after, MAX_DELAY)
+                else:
+                    # Clamp the exponent, the delay is capped long before this and 2 ** 1024 overflows a float
+                    delay = min(MAX_DELAY, BASE_DELAY * (2 ** min(attempt, 16))) * (1 + uniform(-JITTER, JITTER))
+                self.current_attempt[url] = attempt + 1
+
+                if classify_host(host) == 'cyberdrop':
+                    ext = '.'+url.name.split('.')[-1]
                     if ext in FILE_FORMATS['Images']:
-                        args = list(args)
-                        args[0] = args[0].with_host('img-01.cyberdrop.to')
-                        args = tuple(args)
-                    else:
-                        args = list(args)
-                        args[0] = URL(str(args[0]).replace('fs-05.', 'fs-04.'))
-                        args = tuple(args)
-                await asyncio.sleep(2)
+                        args = (url.with_host('img-01.cyberdrop.to'), *args[1:])
+                    elif host.startswith('fs-05.'):
+                        args = (url.with_host('fs-04.' + host[len('fs-05.'):]), *args[1:])
+                    # Carry the attempt count over to the mirror URL
+                    if args[0] != url:
+                        self.current_attempt[args[0]] = self.current_attempt.pop(url)
+
+                await asyncio.sleep(delay)
     return wrapper
 
 
 class Downloader:
     def __init__(self, album_obj: AlbumItem, title: str, max_workers: int, excludes: Dict[str, bool],
-                 SQL_helper: SQLHelper, client: Client, file_args: Dict, runtime_args: Dict):
+                 SQL_helper: SQLHelper, client: Client, file_args: Dict, runtime_args: Dict,
+                 host_semaphores: Optional[Dict[str, asyncio.Semaphore]] = None):
         self.album_obj = album_obj
         self.client = client
         self.folder = file_args['output_folder']
         self.title = title
+        self._album_dir = self.folder / self.title
 
         self.SQL_helper = SQL_helper
         self.File_Lock = FileLock()
 
         self.attempts = runtime_args['attempts']
-        self.current_attempt = {}
+        self.current_attempt: Dict[URL, int] = defaultdict(int)
         self.disable_attempt_limit = runtime_args['disable_attempt_limit']
         self.mark_downloaded = runtime_args['mark_downloaded']
 
         self.excludes = excludes
+        self._excluded_exts = frozenset().union(*(FILE_FORMATS[EXCLUDE_FORMATS[key]]
+                                                  for key, value in excludes.items() if value))
 
         self.max_workers = max_workers
         self._semaphore = asyncio.Semaphore(max_workers)
-        self.delay = {'cyberfile.is': 1, 'anonfiles.com': 1}
+        self._host_semaphores = host_semaphores if host_semaphores is not None else {}
+        self.delay = {'cyberfile': 1, 'anonfiles': 1}
 
         self.proxy = runtime_args['proxy']
 
+        # Shared with other Downloaders for the same folder, set by download_all
+        self._dir_index: Dict[str, int] = {}
+
+        # Download history for this album, prefetched by download_all
+        self._dl_names: Dict[str, str] = {}
+        self._taken_names: Set[str] = set()
+
+    def _semaphore_for(self, host: str) -> asyncio.Semaphore:
+        """Returns the semaphore shared by every album downloading from the host family."""
+        return self._host_semaphores.get(classify_host(host) or DEFAULT_HOST, self._semaphore)
+
+    def _throttle_for(self, host: str) -> Optional[int]:
+        """Returns the host specific throttle (if any)."""
+        return self.delay.get(classify_host(host))
+
+    @staticmethod
+    def get_db_path(url: URL) -> str:
+        """Returns the path the download history is keyed by for the given URL."""
+        db_path = url.path
+        if classify_host(url.host) == 'anonfiles':
+            db_path = db_path.split('/')
+            db_path.pop(0)
+            db_path.pop(1)
+            db_path = '/'+'/'.join(db_path)
+        return db_path
+
+    async def insert_file(self, db_path: str, filename: str, completed: int) -> None:
+        """Records a file in the download history, keeping the prefetched history in sync."""
+        await self.SQL_helper.sql_insert_file(db_path, filename, completed)
+        if db_path not in self._dl_names:
+            self._dl_names[db_path] = filename
+            self._taken_names.add(filename)
+
+    async def update_file(self, db_path: str, filename: str, completed: int) -> None:
+        """Updates a file in the download history, keeping the prefetched history in sync."""
+        await self.SQL_helper.sql_update_file(db_path, filename, completed)
+        self._dl_names[db_path] = filename
+        self._taken_names.add(filename)
+
     """Changed from aiohttp exceptions caught to FailureException to allow for partial downloads."""
 
     @retry
     async def download_file(self, url: URL, referral: URL, filename: str, session: DownloadSession,
-                            show_progress: bool = True) -> None:
+                            show_progress: bool = True, meta: Optional[FileMeta] = None) -> None:
         """Download the content of given URL"""
-        if str(url) not in self.current_attempt:
-            self.current_attempt[str(url)] = 0
+        host = url.host
 
         referer = str(referral)
-        db_path = url.path
+        db_path = self.get_db_path(url)
         current_throttle = self.client.throttle
 
-        if 'anonfiles' in url.host:
-            db_path = db_path.split('/')
-            db_path.pop(0)
-            db_path.pop(1)
-            db_path = '/'+'/'.join(db_path)
+        # The same link can be queued by several albums, wait for whichever one is downloading it
+        link_event = _active_links.get(db_path)
+        while link_event:
+            await link_event.wait()
+            link_event = _active_links.get(db_path)
 
         # return if completed already
-        if await self.SQL_helper.sql_check_existing(db_path):
+        if db_path in self.SQL_helper.completed_paths:
             logger.debug(msg=f"{db_path} found in DB: Skipping {filename}")
             return
+        _active_links[db_path] = asyncio.Event()
 
+        semaphore = self._semaphore_for(host)
+        original_filename = filename
+        # Locks are per path, albums in other folders can use the same filename concurrently
+        lock_key = str(self._album_dir / filename)
+        locked = False
         try:
-            async with self._semaphore:
+            # Wait for the lock before taking a semaphore slot so waiting doesn't hold up other downloads
+            lock_event = await self.File_Lock.get_event(lock_key)
+            while lock_event:
+                await lock_event.wait()
+                lock_event = await self.File_Lock.get_event(lock_key)
+            await self.File_Lock.add_lock(lock_key)
+            locked = True
+
+            async with semaphore:
                 # Make suffix always lower case
-                original_filename = filename
-                ext = '.' + filename.split('.')[-1]
-
-                while await self.File_Lock.check_lock(filename):
-                    await asyncio.sleep(gauss(1, 1.5))
-                await self.File_Lock.add_lock(filename)
-
-                complete_file = (self.folder / self.title / filename)
-                partial_file = complete_file.with_suffix(complete_file.suffix + '.part')
-
-                if complete_file.exists() or partial_file.exists():
-                    if complete_file.exists():
-                        total_size = await session.get_filesize(url, referer, current_throttle)
-                        if complete_file.stat().st_size == total_size:
-                            await self.SQL_helper.sql_insert_file(db_path, complete_file.name, 1)
+                ext = '.' + filename.rpartition('.')[2]
+
+                complete_file = self._album_dir / filename
+
+                if filename in self._dir_index or filename + '.part' in self._dir_index:
+                    if filename in self._dir_index:
+                        if meta:
+                            total_size = meta.size
+                        else:
+                            total_size = await session.get_filesize(url, referer, current_throttle)
+                        if self._dir_index[filename] == total_size:
+                            await self.insert_file(db_path, complete_file.name, 1)
                             logger.debug("\nFile already exists and matches expected size: " + str(complete_file))
                             return
 
-                    download_name = await self.SQL_helper.get_download_filename(db_path)
+                    download_name = self._dl_names.get(db_path)
                     iterations = 1
 
                     if not download_name:
+                        # Candidates are checked against the in-memory index, only free names hit the DB
+                        stem = complete_file.stem
                         while True:
-                            filename = f"{complete_file.stem} ({iterations}){ext}"
+                            filename = f"{stem} ({iterations}){ext}"
                             iterations += 1
-                            temp_complete_file = (self.folder / self.title / filename)
-                            if not temp_complete_file.exists():
+                            if (filename not in self._dir_index and filename + '.part' not in self._dir_index
+                                    and filename not in self._taken_names):
                                 if not await self.SQL_helper.check_filename(filename):
                                     break
                     else:
                         filename = download_name
 
-                await self.SQL_helper.sql_insert_file(db_path, filename, 0)
+                if filename != original_filename:
+                    complete_file = self._album_dir / filename
+                temp_file = complete_file.with_name(filename + '.part')
+                # Reserve the name in the shared index before yielding so other albums in this folder skip it
+                self._dir_index.setdefault(temp_file.name, 0)
+
+                await self.insert_file(db_path, filename, 0)
 
                 if self.mark_downloaded:
-                    await self.SQL_helper.sql_update_file(db_path, filename, 1)
+                    self._dir_index.pop(temp_file.name, None)
+                    await self.update_file(db_path, filename, 1)
                     return
 
-                complete_file = (self.folder / self.title / filename)
-                temp_file = complete_file.with_suffix(complete_file.suffix + '.part')
                 resume_point = 0
-
                 await self.SQL_helper.sql_insert_temp(str(temp_file))
 
                 range_num = None
-                if temp_file.exists():
-                    resume_point = temp_file.stat().st_size
+                try:
+                    resume_point = await aiofiles.os.path.getsize(temp_file)
                     range_num = f'bytes={resume_point}-'
+                except FileNotFoundError:
+                    pass
 
-                for key, value in self.delay.items():
-                    if key in url.host:
-                        current_throttle = value
+                current_throttle = self._throttle_for(host) or self.client.throttle
 
-                await session.download_file(url, referer, current_throttle, range_num, original_filename, filename,
-                                            temp_file, resume_point, show_progress, self.File_Lock, self.folder,
-                                            self.title, self.proxy)
+                size = await session.download_file(url, referer, current_throttle, range_num, filename, temp_file,
+                                                   resume_point, show_progress, self.folder, self.title, self.proxy)
 
-            await self.rename_file(filename, url, db_path)
-            await self.File_Lock.remove_lock(original_filename)
+            await self.rename_file(filename, complete_file, temp_file, db_path, size)
 
         except (aiohttp.client_exceptions.ClientPayloadError, aiohttp.client_exceptions.ClientOSError,
                 aiohttp.client_exceptions.ServerDisconnectedError, asyncio.TimeoutError,
                 aiohttp.client_exceptions.ClientResponseError, FailureException) as e:
-            try:
-                await self.File_Lock.remove_lock(original_filename)
-            except:
-                pass
-
             logger.debug(e)
 
-            try:
-                logger.debug("Error status code: " + str(e.code))
-                if 400 <= e.code < 500 and e.code != 429:
-                    logger.debug("We ran into a 400 level error: %s", str(e.code))
-                    if 'media-files.bunkr' in url.host:
-                        pass
-                    else:
-                        return
-            except Exception:
-                pass
-
-            raise FailureException(code=1, message=e)
-
-    async def rename_file(self, filename: str, url: URL, db_path: str) -> None:
+            # Network errors carry no status code and are always worth retrying
+            code = e.code if isinstance(e, FailureException) else getattr(e, 'status', None)
+            retryable = True
+            if isinstance(code, int):
+                logger.debug("Error status code: " + str(code))
+                if 400 <= code < 500 and code != 429 and 'media-files.bunkr' not in host:
+                    logger.debug("We ran into a 400 level error: %s", str(code))
+                    retryable = False
+
+            raise FailureException(code=1, message=e, retry_after=getattr(e, 'retry_after', None),
+                                   retryable=retryable)
+        finally:
+            # Released whatever happened, a leaked lock would block every later link with this path forever
+            if locked:
+                await self.File_Lock.remove_lock(lock_key)
+            _active_links.pop(db_path).set()
+
+    async def rename_file(self, filename: str, complete_file: Path, temp_file: Path, db_path: str,
+                          size: int) -> None:
         """Rename complete file."""
-        complete_file = (self.folder / self.title / filename)
-        temp_file = complete_file.with_suffix(complete_file.suffix + '.part')
-        if complete_file.exists():
-            logger.debug(str(self.folder / self.title / filename) + " Already Exists")
+        # The index can be stale, only the filesystem decides whether the target exists
+        if await aiofiles.os.path.exists(complete_file):
+            logger.debug(str(complete_file) + " Already Exists")
             await aiofiles.os.remove(temp_file)
         else:
-            temp_file.rename(complete_file)
+            await aiofiles.os.replace(temp_file, complete_file)
+            self._dir_index[filename] = size
+        self._dir_index.pop(temp_file.name, None)
 
-        await self.SQL_helper.sql_update_file(db_path, filename, 1)
+        await self.update_file(db_path, filename, 1)
         logger.debug("Finished " + filename)
 
-    async def get_filename(self, url: URL, referral: URL, session: DownloadSession):
+    async def get_filename(self, url: URL, referral: URL, session: DownloadSession) -> Tuple[str, Optional[FileMeta]]:
         """Does all the necessary work to try and figure out what exactly the Filename should be."""
         referer = str(referral)
 
@@ -202,62 +340,47 @@ class Downloader:
         if "v=" in filename:
             filename = filename.split('v=')[0]
         if len(filename) > MAX_FILENAME_LENGTH:
-            fileext = filename.split('.')[-1]
+            fileext = filename.rpartition('.')[2]
             filename = filename[:MAX_FILENAME_LENGTH] + '.' + fileext
 
-        ext = '.' + filename.split('.')[-1].lower()
+        ext = '.' + filename.rpartition('.')[2].lower()
         current_throttle = self.client.throttle
-        if not (ext in FILE_FORMATS['Images'] or ext in FILE_FORMATS['Videos'] or
-                ext in FILE_FORMATS['Audio'] or ext in FILE_FORMATS['Other']):
-            for key, value in self.delay.items():
-                if key in url.host:
-                    if value > current_throttle:
-                        current_throttle = value
+        meta = None
+        if ext not in VALID_EXTS:
+            host_throttle = self._throttle_for(url.host)
+            if host_throttle and host_throttle > current_throttle:
+                current_throttle = host_throttle
+            # Probes count against the host limit like downloads do
+            async with self._semaphore_for(url.host):
+                meta = await session.get_file_meta(url, referer, current_throttle)
             try:
-                filename = await session.get_filename(url, referer, current_throttle)
-                filename = await sanitize(filename)
-                ext = '.' + filename.split('.')[-1].lower()
-                if not (ext in FILE_FORMATS['Images'] or ext in FILE_FORMATS['Videos']
-                        or ext in FILE_FORMATS['Audio'] or ext in FILE_FORMATS['Other']):
+                if not meta.filename:
+                    raise FailureException(0)
+                filename = await sanitize(meta.filename)
+                ext = '.' + filename.rpartition('.')[2].lower()
+                if ext not in VALID_EXTS:
                     logging.debug("No file extension on content in link: " + str(url))
                     raise FailureException(0)
             except FailureException:
-                try:
-                    content_type = await session.get_content_type(url, referer, current_throttle)
-                    if "image" in content_type:
-                        ext_temp = content_type.split('/')[-1]
-                        filename = filename + '.' + ext_temp
-                        filename = await sanitize(filename)
-                    else:
-                        logging.debug("\nUnhandled content_type for checking filename: " + content_type)
-                        raise FailureException(0)
-                except FailureException:
+                if "image" in meta.content_type:
+                    ext_temp = meta.content_type.split('/')[-1]
+                    filename = filename + '.' + ext_temp
+                    filename = await sanitize(filename)
+                else:
+                    logging.debug("\nUnhandled content_type for checking filename: " + meta.content_type)
                     await log("\nCouldn't get filename for: " + str(url))
                     raise FailureException(0)
 
-        ext = '.' + filename.split('.')[-1].lower()
-        filename = filename.replace('.' + filename.split('.')[-1], ext)
-        return filename
+        fileext = filename.rpartition('.')[2]
+        filename = filename.replace('.' + fileext, '.' + fileext.lower())
+        return filename, meta
 
-    async def check_exclude(self, filename):
+    def check_exclude(self, filename):
         """Check the exclude arguments to see if this file should be skipped (False)."""
-        ext = '.' + filename.split('.')[-1]
-        if self.excludes['videos']:
-            if ext in FILE_FORMATS['Videos']:
-                logging.debug("Skipping " + filename)
-                return False
-        if self.excludes['images']:
-            if ext in FILE_FORMATS['Images']:
-                logging.debug("Skipping " + filename)
-                return False
-        if self.excludes['audio']:
-            if ext in FILE_FORMATS['Audio']:
-                logging.debug("Skipping " + filename)
-                return False
-        if self.excludes['other']:
-            if ext in FILE_FORMATS['Other']:
-                logging.debug("Skipping " + filename)
-                return False
+        ext = '.' + filename.rpartition('.')[2]
+        if ext in self._excluded_exts:
+            logging.debug("Skipping " + filename)
+            return False
         return True
 
     async def download_and_store(self, url_tuple: Tuple, session: DownloadSession, show_progress: bool = True) -> None:
@@ -266,39 +389,79 @@ class Downloader:
 
         logger.debug("Working on " + str(url))
         try:
-            filename = await self.get_filename(url, referral, session)
-            if await self.check_exclude(filename):
+            filename, meta = await self.get_filename(url, referral, session)
+            if self.check_exclude(filename):
                 await self.download_file(url, referral=referral, filename=filename, session=session,
-                                         show_progress=show_progress)
+                                         show_progress=show_progress, meta=meta)
+        except FailureException as e:
+            # Dead links (4xx) are skipped quietly, only failures that exhausted their retries are reported
+            if e.retryable:
+                await log(f"Error attempting {url}")
+            else:
+                logger.debug("Skipped %s: %s", url, e.message)
         except Exception:
             await log(f"Error attempting {url}")
 
     async def download_all(self, album_obj: AlbumItem, session: DownloadSession, show_progress: bool = True) -> None:
         """Download the data from all given links and store them into corresponding files."""
-        coros = [self.download_and_store(url_object, session, show_progress)
-                 for url_object in album_obj.link_pairs]
-        for func in tqdm(asyncio.as_completed(coros), total=len(coros), desc=self.title, unit='FILE'):
-            await func
-
-    async def download_content(self, show_progress: bool = True, conn_timeout: int = 15) -> None:
+        db_paths = [self.get_db_path(url) for url, _ in album_obj.link_pairs]
+        self._dl_names = await self.SQL_helper.bulk_load(db_paths)
+        self._taken_names = set(self._dl_names.values())
+        self._dir_index = await get_dir_index(self._album_dir)
+
+        queue = asyncio.Queue()
+        for url_object in album_obj.link_pairs:
+            queue.put_nowait(url_object)
+
+        num_workers = min(self.max_workers, queue.qsize())
+        with tqdm(total=queue.qsize(), desc=self.title, unit='FILE', mininterval=PROGRESS_INTERVAL) as progress:
+            await asyncio.gather(*(self.download_worker(queue, session, progress, show_progress)
+                                   for _ in range(num_workers)))
+
+    async def download_worker(self, queue: asyncio.Queue, session: DownloadSession, progress: tqdm,
+                              show_progress: bool = True) -> None:
+        """Works through the queued links until none are left."""
+        while not queue.empty():
+            url_object = queue.get_nowait()
+            await self.download_and_store(url_object, session, show_progress)
+            progress.update(1)
+
+    async def download_content(self, session: DownloadSession, show_progress: bool = True) -> None:
         """Download the content of all links and save them as files."""
-        session = DownloadSession(self.client, conn_timeout)
         await self.download_all(self.album_obj, session, show_progress=show_progress)
-        self.SQL_helper.conn.commit()
 
 
 async def get_downloaders(Cascade: CascadeItem, excludes: Dict[str, bool], SQL_helper: SQLHelper, client: Client,
                           max_workers: int, file_args: Dict, runtime_args: Dict) -> List[Downloader]:
     """Get a list of downloader objects to run."""
     downloaders = []
+    limited_workers = LIMITED_HOST_WORKERS if (max_workers > LIMITED_HOST_WORKERS) else max_workers
+    # One semaphore per host family, shared by all albums so --threads holds across the whole run
+    host_semaphores = {key: asyncio.Semaphore(limited_workers if key in LIMITED_HOSTS else max_workers)
+                       for key in HOST_CLASSES}
+    host_semaphores[DEFAULT_HOST] = asyncio.Semaphore(max_workers)
 
     for domain, domain_obj in Cascade.domains.items():
         max_workers_temp = max_workers
-        if 'bunkr' in domain or 'pixeldrain' in domain or 'anonfiles' in domain:
-            max_workers_temp = 2 if (max_workers > 2) else max_workers
+        if classify_host(domain) in LIMITED_HOSTS:
+            max_workers_temp = limited_workers
         for title, album_obj in domain_obj.albums.items():
             downloader = Downloader(album_obj, title=title, max_workers=max_workers_temp, excludes=excludes,
                                     SQL_helper=SQL_helper, client=client,
-                                    file_args=file_args, runtime_args=runtime_args)
+                                    file_args=file_args, runtime_args=runtime_args,
+                                    host_semaphores=host_semaphores)
             downloaders.append(downloader)
     return downloaders
+
+
+async def run_all(downloaders: List[Downloader], session: DownloadSession, show_progress: bool = True,
+                  max_albums: int = MAX_CONCURRENT_ALBUMS) -> None:
+    """Run the downloaders concurrently, a few albums at a time, per host concurrency is bounded by the shared host
+    semaphores."""
+    album_semaphore = asyncio.Semaphore(max_albums)
+
+    async def run_one(downloader: Downloader) -> None:
+        async with album_semaphore:
+            await downloader.download_content(session, show_progress=show_progress)
+
+    await asyncio.gather(*(run_one(downloader) for downloader in downloaders))
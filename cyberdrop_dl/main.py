@@ -15,8 +15,8 @@ from cyberdrop_dl.base_functions.base_functions import clear, create_config, log
     run_args
 from cyberdrop_dl.base_functions.data_classes import AuthData, SkipData
 from cyberdrop_dl.base_functions.sql_helper import SQLHelper
-from cyberdrop_dl.client.client import Client
-from cyberdrop_dl.client.downloaders import get_downloaders
+from cyberdrop_dl.client.client import Client, DownloadSession
+from cyberdrop_dl.client.downloaders import get_downloaders, run_all
 from cyberdrop_dl.scraper.scraper import scrape
 
 
@@ -122,8 +122,13 @@ async def download_all(auth_args: Dict, file_args: Dict, jdownloader_args: Dict,
     downloaders = await get_downloaders(content_object, excludes=excludes, SQL_helper=SQL_helper, client=client,
                                         max_workers=threads, file_args=file_args, runtime_args=runtime_args)
 
-    for downloader in downloaders:
-        await downloader.download_content()
+    # One session for the whole run so albums on the same host reuse warm connections
+    download_session = DownloadSession(client, runtime_args['connection_timeout'])
+    try:
+        await run_all(downloaders, download_session)
+    finally:
+        await download_session.exit_handler()
+        await SQL_helper.commit()
 
 
 async def director(args: argparse.Namespace):